@@ -0,0 +1,37 @@
+from rest_framework.pagination import (BasePagination, CursorPagination,
+                                       PageNumberPagination)
+
+MAX_PAGE_SIZE = 100
+
+
+class PageLimitPagination(PageNumberPagination):
+    page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE
+
+
+class CursorLimitPagination(CursorPagination):
+    page_size_query_param = 'limit'
+    max_page_size = MAX_PAGE_SIZE
+    ordering = ('-created', 'id')
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, 'cursor_ordering', self.ordering)
+
+
+class PageOrCursorPagination(BasePagination):
+    """Постраничная пагинация с count или, по запросу, курсорная.
+
+    Курсорный режим включается параметром pagination=cursor (или наличием
+    cursor) и не выполняет ни OFFSET, ни COUNT(*).
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (request.query_params.get('pagination') == 'cursor'
+                or 'cursor' in request.query_params):
+            self.paginator = CursorLimitPagination()
+        else:
+            self.paginator = PageLimitPagination()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
@@ -1,24 +1,133 @@
 import base64
+import binascii
+import os
 import re
+from collections import Counter
+from io import BytesIO
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.uploadedfile import (InMemoryUploadedFile,
+                                            TemporaryUploadedFile)
 from django.db import transaction
-from django.db.models import F
+from django.utils import timezone
+from PIL import Image
+from recipes.counters import increment
+from recipes.images import VARIANTS, schedule_variants
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingListItem, Tag)
+from recipes.popularity import score
+from recipes.search import update_search_vectors
+from recipes.versions import invalidate_recipe_lists
 from rest_framework import serializers, status
 from rest_framework.exceptions import ValidationError
 from users.models import Follow, User
 
+BASE64_SEPARATOR = ';base64,'
+DECODE_CHUNK_SIZE = 64 * 1024
+WHITESPACE = re.compile(r'\s+')
+
 
 class Base64ImageField(serializers.ImageField):
+    """Картинка в виде data URL.
+
+    base64 декодируется частями во временный файл, который держится в
+    памяти только до FILE_UPLOAD_MAX_MEMORY_SIZE. Слишком большая
+    картинка отклоняется по длине строки до декодирования, картинка со
+    слишком большим числом пикселей — по заголовку первой части.
+    """
+
+    default_error_messages = {
+        **serializers.ImageField.default_error_messages,
+        'invalid_base64': 'Картинка должна быть передана в base64.',
+        'too_large': 'Размер картинки не должен превышать {max_size} МБ.',
+        'too_many_pixels': (
+            'Картинка не должна быть больше {max_pixels} мегапикселей.'
+        ),
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = self.decode(data)
         return super().to_internal_value(data)
 
+    def decode(self, data):
+        start = data.find(BASE64_SEPARATOR)
+        if start == -1:
+            self.fail('invalid_base64')
+        content_type = data[len('data:'):start]
+        name = 'temp.' + content_type.split('/')[-1]
+        start += len(BASE64_SEPARATOR)
+        size = (len(data) - start) * 3 // 4
+        if size > settings.IMAGE_MAX_SIZE:
+            self.fail(
+                'too_large',
+                max_size=f'{settings.IMAGE_MAX_SIZE / 1024 / 1024:g}'
+            )
+        if size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+            file = TemporaryUploadedFile(name, content_type, size, None)
+        else:
+            file = InMemoryUploadedFile(
+                BytesIO(), None, name, content_type, size, None
+            )
+        try:
+            self.write_chunks(file, data, start)
+        except Exception:
+            file.close()
+            raise
+        return file
+
+    def write_chunks(self, file, data, start):
+        checked = False
+        rest = ''
+        for position in range(start, len(data), DECODE_CHUNK_SIZE):
+            # base64 с переносами строк (base64.encodebytes) сдвигает
+            # группы по четыре символа, поэтому неполная группа
+            # переносится в следующую часть.
+            chunk = rest + WHITESPACE.sub(
+                '', data[position:position + DECODE_CHUNK_SIZE]
+            )
+            end = len(chunk) - len(chunk) % 4
+            rest = chunk[end:]
+            self.write_base64(file, chunk[:end])
+            if not checked:
+                checked = self.check_pixels(file)
+                file.seek(0, os.SEEK_END)
+        self.write_base64(file, rest)
+        file.size = file.tell()
+        if not checked:
+            self.check_pixels(file)
+        file.seek(0)
+
+    def write_base64(self, file, chunk):
+        try:
+            file.write(base64.b64decode(chunk))
+        except binascii.Error:
+            self.fail('invalid_base64')
+
+    def check_pixels(self, file):
+        """Проверяет число пикселей по заголовку.
+
+        Возвращает False, если заголовок ещё не прочитан целиком.
+        """
+        file.seek(0)
+        try:
+            with Image.open(file) as image:
+                width, height = image.size
+        except Image.DecompressionBombError:
+            width = height = settings.IMAGE_MAX_PIXELS
+        except Exception:
+            return False
+        if width * height > settings.IMAGE_MAX_PIXELS:
+            self.fail(
+                'too_many_pixels',
+                max_pixels=f'{settings.IMAGE_MAX_PIXELS / 1_000_000:g}'
+            )
+        return True
+
+
+def join_ids(ids):
+    return ', '.join(str(pk) for pk in sorted(ids))
+
 
 class UserSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField(read_only=True)
@@ -39,7 +148,14 @@ class UserSerializer(serializers.ModelSerializer):
             user = self.context.get('request').user
             if user.is_anonymous:
                 return False
-            return Follow.objects.filter(user=user, author=obj).exists()
+            # Один запрос подписок на весь ответ, включая вложенных авторов.
+            if 'subscriptions' not in self.context:
+                self.context['subscriptions'] = set(
+                    Follow.objects.filter(user=user).values_list(
+                        'author_id', flat=True
+                    )
+                )
+            return obj.id in self.context['subscriptions']
         return False
 
 
@@ -109,6 +225,7 @@ class RecipeSerializer(serializers.ModelSerializer):
     tags = TagSerializer(read_only=True, many=True)
     author = UserSerializer(read_only=True)
     image = Base64ImageField(required=True, allow_null=False)
+    images = serializers.SerializerMethodField()
     ingredients = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
@@ -124,25 +241,46 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'images',
             'text',
             'cooking_time',
         )
 
+    def get_images(self, obj):
+        if not obj.image_full:
+            return None
+        request = self.context.get('request')
+        images = {}
+        for name in VARIANTS:
+            url = getattr(obj, f'image_{name}').url
+            images[name] = request.build_absolute_uri(url) if request else url
+        return images
+
     def get_ingredients(self, obj):
-        return obj.ingredients.values(
-            'id',
-            'name',
-            'measurement_unit',
-            amount=F('recipe__amount')
-        )
+        recipe_ingredients = getattr(obj, 'recipe_ingredients', None)
+        if recipe_ingredients is None:
+            recipe_ingredients = obj.ingredient.select_related('ingredient')
+        return [
+            {
+                'id': item.ingredient.id,
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in recipe_ingredients
+        ]
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
         return Favorite.objects.filter(recipe=obj, user=user).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
@@ -173,64 +311,140 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             raise ValidationError(
                 {'tags': 'Это поле обязательно!'}
             )
-        check_list = []
-        for tag in data['tags']:
-            if tag in check_list:
-                raise ValidationError(
-                    {'tags': 'Теги должны быть уникальными!'}
-                )
-            check_list.append(tag)
+        if len(set(data['tags'])) != len(data['tags']):
+            raise ValidationError(
+                {'tags': 'Теги должны быть уникальными!'}
+            )
 
         if not data['ingredients']:
             raise ValidationError(
                 {'ingredients': 'Это поле обязательно!'}
             )
-        check_list = []
-        for ingredient in data['ingredients']:
-            if not Ingredient.objects.filter(id=ingredient['id']).exists():
-                raise ValidationError(
-                    {f'Ингредиента с id {ingredient["id"]} нет в базе!'}
-                )
-            if ingredient.get('id') in check_list:
-                raise ValidationError(
-                    {'ingredients': 'Ингредиенты не должны повторяться!'}
-                )
-            if int(ingredient['amount']) <= 0:
-                raise ValidationError({
-                    'amount':
-                    'Убедитесь, что это значение больше либо равно 1.'
-                })
-            check_list.append(ingredient.get('id'))
+        ids = [ingredient['id'] for ingredient in data['ingredients']]
+        errors = {}
+        missing = set(ids) - set(
+            Ingredient.objects.filter(id__in=ids).values_list('id', flat=True)
+        )
+        if missing:
+            errors.setdefault('ingredients', []).append(
+                f'Ингредиентов с id {join_ids(missing)} нет в базе!'
+            )
+        duplicates = {
+            ingredient_id for ingredient_id, count in Counter(ids).items()
+            if count > 1
+        }
+        if duplicates:
+            errors.setdefault('ingredients', []).append(
+                'Ингредиенты не должны повторяться! '
+                f'Повторяются id {join_ids(duplicates)}.'
+            )
+        wrong_amount = {
+            ingredient['id'] for ingredient in data['ingredients']
+            if int(ingredient['amount']) <= 0
+        }
+        if wrong_amount:
+            errors['amount'] = (
+                'Убедитесь, что это значение больше либо равно 1. '
+                f'Ошибка у ингредиентов с id {join_ids(wrong_amount)}.'
+            )
+        if errors:
+            raise ValidationError(errors)
         return data
 
     @transaction.atomic
     def create_recipe_ingredients(self, recipe, ingredients):
-        for ingredient in ingredients:
-            RecipeIngredient.objects.create(
-                ingredient=Ingredient.objects.get(id=ingredient['id']),
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                ingredient_id=ingredient['id'],
                 recipe=recipe,
                 amount=ingredient['amount']
             )
+            for ingredient in ingredients
+        )
+
+    @transaction.atomic
+    def update_recipe_ingredients(self, recipe, ingredients):
+        """Применяет к рецепту только изменившиеся ингредиенты.
+
+        Возвращает id добавленных, изменённых и удалённых ингредиентов.
+        """
+        current = getattr(recipe, 'recipe_ingredients', None)
+        if current is None:
+            current = recipe.ingredient.all()
+        current = {item.ingredient_id: item for item in current}
+        amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        removed = current.keys() - amounts.keys()
+        added = amounts.keys() - current.keys()
+        changed = [
+            item for item in current.values()
+            if item.ingredient_id in amounts
+            and item.amount != amounts[item.ingredient_id]
+        ]
+        if removed:
+            recipe.ingredient.filter(ingredient__in=removed).delete()
+        for item in changed:
+            item.amount = amounts[item.ingredient_id]
+        RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        self.create_recipe_ingredients(
+            recipe,
+            [ingredient for ingredient in ingredients
+             if ingredient['id'] in added]
+        )
+        return removed | added | {item.ingredient_id for item in changed}
 
     @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
-        recipe = Recipe.objects.create(**validated_data)
+        # Точное значение посчитает refresh_popularity, а до тех пор новый
+        # рецепт не должен оказаться в конце популярных.
+        recipe = Recipe.objects.create(
+            popularity=score(0, timezone.now()), **validated_data
+        )
+        increment(
+            User.objects.filter(pk=recipe.author_id), 'recipes_count'
+        )
         recipe.tags.set(tags)
         self.create_recipe_ingredients(recipe, ingredients)
+        update_search_vectors([recipe.pk])
+        schedule_variants(recipe)
+        transaction.on_commit(
+            lambda: invalidate_recipe_lists(recipe.author_id, tags)
+        )
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
+        ShoppingListItem.lock(instance.in_cart.values('user'))
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
+        changed_tags = set(instance.tags.all()) | set(tags)
+        old_image = instance.image.name
         instance = super().update(instance, validated_data)
+        # Одинаковая картинка получает то же имя и не обрабатывается заново.
+        # Старые файлы удаляет collect_images: сразу после коммита их ещё
+        # может использовать параллельная загрузка той же картинки.
+        if instance.image.name != old_image:
+            instance.image_thumbnail = ''
+            instance.image_card = ''
+            instance.image_full = ''
+            instance.save(update_fields=(
+                'image_thumbnail', 'image_card', 'image_full'
+            ))
+            schedule_variants(instance)
         instance.tags.set(tags)
-        instance.image = validated_data.get('image', instance.image)
-        instance.ingredients.clear()
-        self.create_recipe_ingredients(instance, ingredients)
-        instance.save()
+        transaction.on_commit(
+            lambda: invalidate_recipe_lists(instance.author_id, changed_tags)
+        )
+        changed = self.update_recipe_ingredients(instance, ingredients)
+        update_search_vectors([instance.pk])
+        # Предзагруженные через RecipeViewSet строки больше не актуальны.
+        instance.__dict__.pop('recipe_ingredients', None)
+        if changed:
+            ShoppingListItem.refresh(instance.in_cart.values('user'), changed)
         return instance
 
     def to_representation(self, instance):
@@ -239,16 +453,32 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         return RecipeSerializer(instance, context=context).data
 
 
+class CookQuerySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100
+    )
+    max_cooking_time = serializers.IntegerField(min_value=1, required=False)
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=100
+    )
+
+
 class ShortRecipeSerializer(RecipeSerializer):
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
 
 
 class FollowSerializer(serializers.ModelSerializer):
     recipes = ShortRecipeSerializer(many=True, read_only=True)
-    recipes_count = serializers.SerializerMethodField()
     is_subscribed = serializers.SerializerMethodField(read_only=True, )
 
     class Meta:
@@ -263,7 +493,7 @@ class FollowSerializer(serializers.ModelSerializer):
             'recipes',
             'recipes_count',
         )
-        read_only_fields = ('email', 'username')
+        read_only_fields = ('email', 'username', 'recipes_count')
 
     def validate(self, data):
         author = self.instance
@@ -280,8 +510,5 @@ class FollowSerializer(serializers.ModelSerializer):
             )
         return data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.all().count()
-
     def get_is_subscribed(self, obj):
         return True
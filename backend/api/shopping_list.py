@@ -0,0 +1,37 @@
+import csv
+
+SHOPPING_LIST_TITLE = 'Список покупок'
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def txt_lines(ingredients):
+    yield f'{SHOPPING_LIST_TITLE}\n\n'
+    for ingredient in ingredients:
+        yield (
+            f'{ingredient["ingredient__name"]} '
+            f'({ingredient["ingredient__measurement_unit"]}) - '
+            f'{ingredient["amount"]}\n'
+        )
+
+
+def csv_lines(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Единица измерения', 'Количество'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['amount'],
+        ))
+
+
+FORMATS = {
+    'txt': (txt_lines, 'text/plain; charset=utf-8'),
+    'csv': (csv_lines, 'text/csv; charset=utf-8'),
+}
@@ -0,0 +1,281 @@
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from rest_framework.test import APIClient
+from users.models import Follow, User
+
+RECIPES_URL = '/api/recipes/'
+
+
+class RecipeListQueriesTest(TestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{number}', email=f'author{number}@test.ru',
+                first_name='Автор', last_name=str(number), password='pass'
+            )
+            for number in range(2)
+        ]
+        cls.reader = User.objects.create_user(
+            username='reader', email='reader@test.ru',
+            first_name='Читатель', last_name='Читателев', password='pass'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.authors[0])
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}', color='#FFFFFF',
+                               slug=f'tag{number}')
+            for number in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Продукт {number}',
+                                      measurement_unit='г')
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        self.anonymous = APIClient()
+        self.authenticated = APIClient()
+        self.authenticated.force_authenticate(self.reader)
+
+    def create_recipes(self, count):
+        for number in range(count):
+            recipe = Recipe.objects.create(
+                author=self.authors[number % 2],
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/test.png',
+            )
+            recipe.tags.set(self.tags)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=100)
+                for ingredient in self.ingredients
+            )
+
+    def get_recipes(self, client):
+        # Анонимные ответы кешируются, а нужен полный путь до базы.
+        cache.clear()
+        response = client.get(RECIPES_URL, {'limit': 50})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assert_flat(self, client):
+        self.create_recipes(2)
+        with CaptureQueriesContext(connection) as queries:
+            self.get_recipes(client)
+        self.create_recipes(20)
+        with self.assertNumQueries(len(queries)):
+            response = self.get_recipes(client)
+        self.assertEqual(len(response.data['results']), 22)
+
+    def test_anonymous_list(self):
+        self.assert_flat(self.anonymous)
+
+    def test_authenticated_list(self):
+        self.assert_flat(self.authenticated)
+
+
+class UncountedRowsTest(TestCase):
+    """Удаление строк, созданных в обход API, не уводит счётчики в минус."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@test.ru',
+            first_name='Автор', last_name='Авторов', password='pass'
+        )
+        cls.reader = User.objects.create_user(
+            username='reader', email='reader@test.ru',
+            first_name='Читатель', last_name='Читателев', password='pass'
+        )
+
+    def setUp(self):
+        # Как в админке или loaddata: строки есть, счётчики не менялись.
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipes/images/test.png',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def test_favorite(self):
+        Favorite.objects.create(user=self.reader, recipe=self.recipe)
+        response = self.client.delete(
+            f'{RECIPES_URL}{self.recipe.pk}/favorite/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+
+    def test_favorites_bulk(self):
+        Favorite.objects.create(user=self.reader, recipe=self.recipe)
+        response = self.client.delete(
+            f'{RECIPES_URL}favorite/', {'recipes': [self.recipe.pk]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+
+    def test_shopping_cart(self):
+        ShoppingCart.objects.create(user=self.reader, recipe=self.recipe)
+        response = self.client.delete(
+            f'{RECIPES_URL}{self.recipe.pk}/shopping_cart/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.carts_count, 0)
+
+    def test_recipe(self):
+        self.client.force_authenticate(self.author)
+        response = self.client.delete(f'{RECIPES_URL}{self.recipe.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 0)
+
+    def test_subscription(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.client.delete(
+            f'/api/users/{self.author.pk}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 0)
+
+
+class RecipeETagTest(TestCase):
+    """ETag рецепта меняется вместе с данными вложенного автора."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@test.ru',
+            first_name='Автор', last_name='Авторов', password='pass'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipes/images/test.png',
+        )
+
+    def test_author_renamed(self):
+        client = APIClient()
+        url = f'{RECIPES_URL}{self.recipe.pk}/'
+        etag = client.get(url)['ETag']
+        self.assertEqual(
+            client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        User.objects.filter(pk=self.author.pk).update(first_name='Повар')
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['author']['first_name'], 'Повар')
+
+
+class SubscriptionRecipesLimitTest(TestCase):
+    """recipes_limit оставляет каждому автору его последние рецепты."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(
+            username='reader', email='reader@test.ru',
+            first_name='Читатель', last_name='Читателев', password='pass'
+        )
+        cls.latest = {}
+        for number in range(3):
+            author = User.objects.create_user(
+                username=f'author{number}', email=f'author{number}@test.ru',
+                first_name='Автор', last_name=str(number), password='pass'
+            )
+            Follow.objects.create(user=cls.reader, author=author)
+            recipes = [
+                Recipe.objects.create(
+                    author=author, name=f'Рецепт {number}.{index}',
+                    text='Описание', cooking_time=10,
+                    image='recipes/images/test.png',
+                )
+                for index in range(number + 1)
+            ]
+            cls.latest[author.pk] = [recipe.pk for recipe in recipes[::-1]]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def get_recipes(self, params):
+        response = self.client.get('/api/users/subscriptions/', params)
+        self.assertEqual(response.status_code, 200)
+        return {
+            author['id']: [recipe['id'] for recipe in author['recipes']]
+            for author in response.data['results']
+        }
+
+    def test_limit(self):
+        self.assertEqual(
+            self.get_recipes({'recipes_limit': 2}),
+            {pk: ids[:2] for pk, ids in self.latest.items()}
+        )
+
+    def test_no_limit(self):
+        self.assertEqual(self.get_recipes({}), self.latest)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN plans of PostgreSQL')
+class IndexUsageTest(TestCase):
+    """Частые запросы API обслуживаются индексами, а не полным просмотром."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@test.ru',
+            first_name='Пользователь', last_name='Тестовый', password='pass'
+        )
+
+    def setUp(self):
+        # На почти пустых таблицах планировщик предпочёл бы Seq Scan.
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assert_uses_index(self, queryset, index):
+        self.assertIn(index, queryset.explain())
+
+    def test_recipe_list(self):
+        self.assert_uses_index(
+            Recipe.objects.order_by('-created', 'id')[:10],
+            'recipe_created_id_idx'
+        )
+
+    def test_favorite_and_cart_flags(self):
+        self.assert_uses_index(
+            Favorite.objects.filter(user=self.user).values('recipe'),
+            'favorite_user_recipe_idx'
+        )
+        self.assert_uses_index(
+            ShoppingCart.objects.filter(user=self.user).values('recipe'),
+            'cart_user_recipe_idx'
+        )
+
+    def test_subscriptions(self):
+        self.assert_uses_index(
+            Follow.objects.filter(user=self.user).values('author'),
+            'follow_user_author_idx'
+        )
+
+    def test_subscription_recipes(self):
+        self.assert_uses_index(
+            Recipe.objects.filter(author=self.user).order_by('-created', 'id'),
+            'recipe_author_created_idx'
+        )
+
+    def test_ingredient_prefix(self):
+        self.assert_uses_index(
+            Ingredient.objects.filter(name__startswith='сол'),
+            'ingredient_name_like_idx'
+        )
@@ -91,6 +91,22 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# Например, для файлового кеша CACHE_BACKEND=
+# django.core.cache.backends.filebased.FileBasedCache и
+# CACHE_LOCATION=/var/tmp/foodgram_cache
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -154,3 +170,21 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Потоки фоновой обработки картинок рецептов
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+# Ограничения на загружаемые картинки: размер в байтах и число пикселей
+
+IMAGE_MAX_SIZE = int(os.getenv('IMAGE_MAX_SIZE', 10 * 1024 * 1024))
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', 40_000_000))
+
+# Рейтинг популярности: рецепт в 10 раз популярнее стоит наравне
+# с рецептом, опубликованным на столько часов позже
+
+POPULARITY_DECAY_HOURS = int(os.getenv('POPULARITY_DECAY_HOURS', 24 * 7))
+
+# Сколько последних рецептов хранится в ленте подписок пользователя
+
+FEED_SIZE = int(os.getenv('FEED_SIZE', 500))
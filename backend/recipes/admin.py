@@ -1,6 +1,9 @@
 from django.contrib import admin
+from django.db import transaction
+from django.db.models import Q
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingListItem, Tag)
+from recipes.search import search_recipes, update_search_vectors
 
 
 class IngredientsInLine(admin.TabularInline):
@@ -9,16 +12,71 @@ class IngredientsInLine(admin.TabularInline):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author', 'show_favorite')
-    readonly_fields = ('show_favorite',)
+    list_display = ('name', 'author', 'favorites_count')
+    readonly_fields = ('favorites_count',)
     search_fields = ('text', 'name', )
     list_filter = ('author', 'name', 'tags')
     inlines = [IngredientsInLine]
 
-    def show_favorite(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        # Полнотекстовый поиск не находит части слов, поэтому к нему
+        # добавляются совпадения обычного поиска по search_fields.
+        matched, _ = super().get_search_results(
+            request, queryset, search_term
+        )
+        return queryset.filter(
+            Q(pk__in=search_recipes(queryset, search_term).values('pk'))
+            | Q(pk__in=matched.values('pk'))
+        ), False
 
-    show_favorite.short_description = 'Добавлен в избранное'
+    # Админка меняет рецепты в обход API, поэтому поисковый вектор и
+    # списки покупок затронутых пользователей пересчитываются здесь же.
+    def save_model(self, request, obj, form, change):
+        if change:
+            ShoppingListItem.lock(obj.in_cart.values('user'))
+        super().save_model(request, obj, form, change)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        update_search_vectors([form.instance.pk])
+        if change:
+            ShoppingListItem.refresh(form.instance.in_cart.values('user'))
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Recipe.objects.filter(pk=obj.pk))
+
+    # Массовое удаление из списка объектов идёт вне транзакции, а
+    # блокировка пользователей работает только внутри неё.
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        buyers = list(ShoppingCart.objects.filter(
+            recipe__in=queryset
+        ).values_list('user', flat=True).distinct())
+        ShoppingListItem.lock(buyers)
+        super().delete_queryset(request, queryset)
+        ShoppingListItem.refresh(buyers)
+
+
+class ShoppingCartAdmin(admin.ModelAdmin):
+    def save_model(self, request, obj, form, change):
+        users = [obj.user_id]
+        if change:
+            users.append(form.initial['user'])
+        ShoppingListItem.lock(users)
+        super().save_model(request, obj, form, change)
+        ShoppingListItem.refresh(users)
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, ShoppingCart.objects.filter(pk=obj.pk))
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        users = list(queryset.values_list('user', flat=True).distinct())
+        ShoppingListItem.lock(users)
+        super().delete_queryset(request, queryset)
+        ShoppingListItem.refresh(users)
 
 
 class IngredientAdmin(admin.ModelAdmin):
@@ -30,4 +88,4 @@ admin.site.register(Tag)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Favorite)
-admin.site.register(ShoppingCart)
+admin.site.register(ShoppingCart, ShoppingCartAdmin)
@@ -1,5 +1,18 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class RecipesConfig(AppConfig):
     name = 'recipes'
+
+    def ready(self):
+        from recipes.models import Ingredient, Tag
+        from recipes.search import update_ingredient_recipes
+        from recipes.versions import invalidate_ingredients, invalidate_tags
+
+        post_save.connect(invalidate_ingredients, sender=Ingredient)
+        post_delete.connect(invalidate_ingredients, sender=Ingredient)
+        post_save.connect(invalidate_tags, sender=Tag)
+        post_delete.connect(invalidate_tags, sender=Tag)
+        # Название ингредиента входит в поисковые векторы рецептов.
+        post_save.connect(update_ingredient_recipes, sender=Ingredient)
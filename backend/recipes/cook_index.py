@@ -0,0 +1,142 @@
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from datetime import timedelta
+from itertools import groupby
+from operator import itemgetter
+from threading import Lock
+
+from django.utils import timezone
+from recipes.models import Recipe, RecipeIngredient
+from recipes.versions import get_version
+
+RESULTS_LIMIT = 500
+# Запас на транзакции, закоммиченные позже своего поля updated.
+SYNC_MARGIN = timedelta(minutes=1)
+
+_lock = Lock()
+_index = None
+
+
+class CookIndex:
+    """Обратный индекс ингредиент -> рецепты в памяти процесса.
+
+    Для каждого ингредиента хранится отсортированный массив id рецептов,
+    поэтому подбор рецептов по продуктам — это подсчёт вхождений по
+    нескольким массивам, без запросов к RecipeIngredient.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(lambda: array('I'))
+        self.recipes = {}
+        self.version = None
+        self.synced_at = None
+
+    def add(self, pk, cooking_time, ingredients):
+        self.remove(pk)
+        ingredients = tuple(set(ingredients))
+        self.recipes[pk] = (cooking_time, ingredients)
+        for ingredient in ingredients:
+            insort(self.postings[ingredient], pk)
+
+    def remove(self, pk):
+        recipe = self.recipes.pop(pk, None)
+        if recipe is None:
+            return
+        for ingredient in recipe[1]:
+            postings = self.postings[ingredient]
+            position = bisect_left(postings, pk)
+            if position < len(postings) and postings[position] == pk:
+                del postings[position]
+
+    def load(self, recipes, rows):
+        """Добавляет рецепты (id, cooking_time) с ингредиентами.
+
+        rows — пары (recipe, ingredient), отсортированные по рецепту.
+        """
+        ingredients = {
+            pk: [ingredient for _, ingredient in group]
+            for pk, group in groupby(rows, key=itemgetter(0))
+        }
+        for pk, cooking_time in recipes:
+            self.add(pk, cooking_time, ingredients.get(pk, ()))
+
+    def search(self, ingredients, max_cooking_time=None,
+               limit=RESULTS_LIMIT):
+        """Возвращает [(id, совпало, не хватает)], лучшие первыми.
+
+        Рецепты упорядочены по числу имеющихся ингредиентов, затем по
+        числу недостающих и по новизне.
+        """
+        covered = Counter()
+        for ingredient in set(ingredients):
+            postings = self.postings.get(ingredient)
+            if postings:
+                covered.update(postings)
+        # Сортировать все совпадения дорого: рецептов только с солью
+        # могут быть десятки тысяч. Кандидаты берутся по уровням числа
+        # совпадений сверху вниз, пока их не наберётся limit.
+        levels = sorted(Counter(covered.values()).items(), reverse=True)
+        found = []
+        upper = None
+        while levels and len(found) < limit:
+            needed = limit - len(found)
+            threshold = levels[-1][0]
+            for level, size in levels:
+                needed -= size
+                if needed <= 0:
+                    threshold = level
+                    break
+            levels = [item for item in levels if item[0] < threshold]
+            found.extend(
+                (pk, count, len(self.recipes[pk][1]) - count)
+                for pk, count in covered.items()
+                if threshold <= count and (upper is None or count < upper)
+                and (max_cooking_time is None
+                     or self.recipes[pk][0] <= max_cooking_time)
+            )
+            upper = threshold
+        found.sort(key=lambda item: (-item[1], item[2], -item[0]))
+        return found[:limit]
+
+
+def load_recipes(index, recipes):
+    index.load(
+        recipes.order_by('id').values_list('id', 'cooking_time'),
+        RecipeIngredient.objects.filter(recipe__in=recipes).order_by(
+            'recipe'
+        ).values_list('recipe', 'ingredient')
+    )
+
+
+def sync(index):
+    """Догружает рецепты, изменённые после прошлой синхронизации."""
+    started = timezone.now()
+    if index.synced_at is None:
+        load_recipes(index, Recipe.objects.all())
+    else:
+        load_recipes(index, Recipe.objects.filter(
+            updated__gte=index.synced_at - SYNC_MARGIN
+        ))
+        # Удалённые рецепты видны только по расхождению количества.
+        if Recipe.objects.count() != len(index.recipes):
+            existing = set(Recipe.objects.values_list('id', flat=True))
+            for pk in index.recipes.keys() - existing:
+                index.remove(pk)
+    index.synced_at = started
+
+
+def find_recipes(ingredients, max_cooking_time=None):
+    """Ищет рецепты по продуктам, синхронизируя индекс при необходимости.
+
+    Индекс меняется на месте, поэтому поиск идёт под той же блокировкой.
+    """
+    global _index
+    version, _ = get_version('recipes')
+    with _lock:
+        if _index is None:
+            _index = CookIndex()
+        if _index.version != version:
+            sync(_index)
+            _index.version = version
+        return _index.search(ingredients, max_cooking_time)
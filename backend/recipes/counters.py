@@ -0,0 +1,37 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Follow, User
+
+# Модель и поле счётчика, модель и поле, по которым он считается.
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'carts_count', ShoppingCart, 'recipe'),
+    (User, 'followers_count', Follow, 'author'),
+    (User, 'recipes_count', Recipe, 'author'),
+)
+
+
+def increment(queryset, field, delta=1, **values):
+    """Меняет счётчик одним UPDATE, без чтения значения в Python.
+
+    values — другие поля, которые нужно записать тем же запросом.
+    Строки из админки и loaddata счётчик не учитывает, поэтому при
+    уменьшении он не опускается ниже нуля.
+    """
+    value = F(field) + delta
+    if delta < 0:
+        value = Greatest(value, 0)
+    if delta:
+        queryset.update(**{field: value}, **values)
+
+
+def actual_count(model, field):
+    """Подзапрос с настоящим значением счётчика для OuterRef('pk')."""
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            count=Count('pk')
+        ).values('count')
+    ), 0)
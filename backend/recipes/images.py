@@ -0,0 +1,94 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+from recipes.models import Recipe
+from recipes.storage import content_storage
+from recipes.versions import invalidate_recipe_lists
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'full': (1280, 1280),
+}
+if features.check('webp'):
+    FORMAT, EXTENSION = 'WEBP', 'webp'
+else:
+    FORMAT, EXTENSION = 'JPEG', 'jpg'
+IMAGE_FIELDS = ('image', 'image_thumbnail', 'image_card', 'image_full')
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_WORKERS, thread_name_prefix='recipe-images'
+)
+
+
+def schedule_variants(recipe):
+    """Ставит обработку картинки рецепта в очередь после коммита."""
+    recipe_id, image = recipe.pk, recipe.image.name
+    transaction.on_commit(
+        lambda: _executor.submit(process_in_background, recipe_id, image)
+    )
+
+
+def make_variants(file):
+    """Возвращает {вариант: байты} уменьшенных копий без метаданных."""
+    with Image.open(file) as image:
+        image.verify()
+    file.seek(0)
+    with Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ('RGBA', 'LA', 'P')
+        image = image.convert(
+            'RGBA' if has_alpha and FORMAT == 'WEBP' else 'RGB'
+        )
+        variants = {}
+        for name, size in VARIANTS.items():
+            variant = image.copy()
+            variant.thumbnail(size, Image.LANCZOS)
+            buffer = BytesIO()
+            variant.save(buffer, FORMAT, quality=85)
+            variants[name] = buffer.getvalue()
+    return variants
+
+
+def save_variant(name, content):
+    return content_storage.save(
+        f'recipes/images/{name}/variant.{EXTENSION}', ContentFile(content)
+    )
+
+
+def process_variants(recipe_id, image):
+    try:
+        with content_storage.open(image) as file:
+            variants = make_variants(file)
+        paths = {
+            f'image_{name}': save_variant(name, content)
+            for name, content in variants.items()
+        }
+        # Картинку могли заменить, пока шла обработка.
+        if Recipe.objects.filter(pk=recipe_id, image=image).update(
+            updated=timezone.now(), **paths
+        ):
+            recipe = Recipe.objects.get(pk=recipe_id)
+            invalidate_recipe_lists(recipe.author_id, recipe.tags.all())
+    except Exception:
+        logger.exception('Не удалось обработать картинку %s', image)
+
+
+def process_in_background(recipe_id, image):
+    """Обрабатывает картинку в потоке пула и закрывает его соединения.
+
+    Вызывающий поток своё соединение не теряет: process_images читает
+    рецепты курсором, пока обрабатывает картинки.
+    """
+    try:
+        process_variants(recipe_id, image)
+    finally:
+        connections.close_all()
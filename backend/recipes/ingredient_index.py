@@ -0,0 +1,63 @@
+from bisect import bisect_left
+from threading import Lock
+
+from api.serializers import IngredientSerializer
+from recipes.models import Ingredient
+from recipes.versions import get_version
+
+SEARCH_LIMIT = 50
+
+_lock = Lock()
+_index = None
+
+
+class IngredientIndex:
+    """Каталог ингредиентов в памяти процесса.
+
+    Поиск по началу названия идёт бинарным поиском по отсортированным
+    названиям в нижнем регистре, совпадения внутри названия добавляются
+    после них.
+    """
+
+    def __init__(self, items, version):
+        self.version = version
+        self.items = list(items)
+        self.keys = sorted(
+            (item['name'].lower(), position)
+            for position, item in enumerate(self.items)
+        )
+        self.names = [name for name, _ in self.keys]
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        query = query.lower()
+        found = []
+        start = bisect_left(self.names, query)
+        for name, position in self.keys[start:]:
+            if not name.startswith(query) or len(found) == limit:
+                break
+            found.append(self.items[position])
+        if len(found) < limit:
+            for name, position in self.keys:
+                if query in name and not name.startswith(query):
+                    found.append(self.items[position])
+                    if len(found) == limit:
+                        break
+        return found
+
+
+def get_index():
+    """Возвращает индекс, перестраивая его после изменения ингредиентов."""
+    global _index
+    version, _ = get_version('ingredients')
+    if _index is None or _index.version != version:
+        with _lock:
+            if _index is None or _index.version != version:
+                # Элементы совпадают с ответом retrieve для того же
+                # ингредиента.
+                _index = IngredientIndex(
+                    IngredientSerializer(
+                        Ingredient.objects.order_by('id'), many=True
+                    ).data,
+                    version
+                )
+    return _index
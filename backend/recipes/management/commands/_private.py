@@ -0,0 +1,113 @@
+import json
+
+from recipes.versions import is_shared_cache
+
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = ' \t\r\n'
+# Обрезанная escape-последовательность \uXXXX занимает до шести символов.
+TAIL = 6
+# Состояния разбора: ждём '[', первый элемент или ']', элемент,
+# ',' или ']', конец файла.
+TRANSITIONS = {
+    ('start', '['): 'first',
+    ('first', ']'): 'end',
+    ('separator', ','): 'item',
+    ('separator', ']'): 'end',
+}
+ERRORS = {
+    'start': 'Expected a JSON array, got {char!r}',
+    'separator': 'Expected "," or "]", got {char!r}',
+    'end': 'Unexpected {char!r} after the end of the JSON array',
+}
+
+
+def skip_whitespace(buffer, position):
+    while position < len(buffer) and buffer[position] in WHITESPACE:
+        position += 1
+    return position
+
+
+def is_truncated(buffer, error):
+    """Можно ли исправить ошибку разбора, дочитав файл."""
+    return (
+        error.pos >= len(buffer) - TAIL
+        or error.msg.startswith('Unterminated string')
+    )
+
+
+def decode_item(decoder, buffer, position, eof):
+    """Разбирает элемент массива в позиции position.
+
+    Возвращает (элемент, конец) или None, если элемент может
+    продолжаться в ещё не прочитанной части файла.
+    """
+    try:
+        item, end = decoder.raw_decode(buffer, position)
+    except json.JSONDecodeError as error:
+        if not eof and is_truncated(buffer, error):
+            return None
+        raise ValueError(f'Invalid JSON: {error}') from None
+    # Число или литерал на границе части могут быть неполными:
+    # элемент принимается, только когда за ним виден разделитель.
+    following = skip_whitespace(buffer, end)
+    if not eof and (
+        following == len(buffer)
+        or buffer[following] not in ',]'
+        and end >= len(buffer) - TAIL
+    ):
+        return None
+    return item, end
+
+
+def iter_json_array(file, chunk_size=CHUNK_SIZE):
+    """Читает JSON-массив по частям и возвращает элементы по одному.
+
+    Обрезанный или испорченный файл вызывает ValueError, поэтому
+    загрузка не завершается успешно на части данных.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    state = 'start'
+    eof = False
+    while not eof:
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            position = skip_whitespace(buffer, position)
+            if position == len(buffer):
+                break
+            char = buffer[position]
+            if (state, char) in TRANSITIONS:
+                position += 1
+                state = TRANSITIONS[state, char]
+            elif state in ('first', 'item'):
+                decoded = decode_item(decoder, buffer, position, eof)
+                if decoded is None:
+                    break
+                item, position = decoded
+                state = 'separator'
+                yield item
+            else:
+                raise ValueError(ERRORS[state].format(char=char))
+    if state != 'end':
+        raise ValueError('Unexpected end of the JSON array')
+
+
+def warn_if_local_cache(command, what):
+    """Предупреждает, что запущенный бэкенд изменений не увидит.
+
+    Команда работает в своём процессе, и с локальным кешем её сброс
+    версий до процессов gunicorn не доходит. Возвращает True, если кеш
+    общий и сбрасывать его имеет смысл.
+    """
+    if is_shared_cache():
+        return True
+    command.stderr.write(command.style.WARNING(
+        f'The cache is local to each process: the running backend keeps '
+        f'serving cached {what} until it is restarted. Configure a shared '
+        f'CACHE_BACKEND to apply changes without a restart.'
+    ))
+    return False
@@ -0,0 +1,68 @@
+import random
+from statistics import quantiles
+from time import perf_counter
+
+from django.core.management import BaseCommand, CommandError
+from recipes.cook_index import CookIndex
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures build time and query latency of the "what can I cook" '
+        'index on synthetic data and fails if p95 exceeds the target.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100_000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--per-recipe', type=int, default=8)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--query-size', type=int, default=10)
+        parser.add_argument('--target-ms', type=float, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if options['queries'] < 2:
+            raise CommandError('--queries must be at least 2')
+        rng = random.Random(options['seed'])
+        ingredients = range(1, options['ingredients'] + 1)
+        # Популярные продукты вроде соли встречаются в рецептах чаще.
+        weights = [1 / pk for pk in ingredients]
+        rows = [
+            (pk, ingredient)
+            for pk in range(1, options['recipes'] + 1)
+            for ingredient in sorted(set(rng.choices(
+                ingredients, weights, k=options['per_recipe']
+            )))
+        ]
+        recipes = [
+            (pk, rng.randint(5, 180))
+            for pk in range(1, options['recipes'] + 1)
+        ]
+        started = perf_counter()
+        index = CookIndex()
+        index.load(recipes, rows)
+        build = perf_counter() - started
+        timings = []
+        for _ in range(options['queries']):
+            query = rng.choices(
+                ingredients, weights, k=options['query_size']
+            )
+            max_cooking_time = rng.choice((None, 30, 60))
+            started = perf_counter()
+            index.search(query, max_cooking_time)
+            timings.append((perf_counter() - started) * 1000)
+        percentiles = quantiles(timings, n=100)
+        p50, p95, p99 = percentiles[49], percentiles[94], percentiles[98]
+        self.stdout.write(
+            f'{len(recipes)} recipes, {len(rows)} rows, '
+            f'build {build:.2f}s'
+        )
+        self.stdout.write(
+            f'query p50 {p50:.1f}ms, p95 {p95:.1f}ms, p99 {p99:.1f}ms'
+        )
+        if p95 > options['target_ms']:
+            raise CommandError(
+                f'p95 {p95:.1f}ms exceeds the {options["target_ms"]}ms target'
+            )
+        self.stdout.write(self.style.SUCCESS('Within the latency target'))
@@ -0,0 +1,49 @@
+import os
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+from recipes.images import IMAGE_FIELDS
+from recipes.models import Recipe
+from recipes.storage import content_storage
+
+ROOT = 'recipes/images'
+
+
+def iter_files(path):
+    directories, files = content_storage.listdir(path)
+    for name in files:
+        yield os.path.join(path, name)
+    for directory in directories:
+        yield from iter_files(os.path.join(path, directory))
+
+
+class Command(BaseCommand):
+    help = 'Deletes recipe images that no recipe references anymore.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=60,
+            help='Skip files modified less than this many minutes ago.'
+        )
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        if not content_storage.exists(ROOT):
+            return
+        used = set()
+        for field in IMAGE_FIELDS:
+            used.update(Recipe.objects.values_list(field, flat=True))
+        # Свежие файлы могут принадлежать ещё не сохранённому рецепту.
+        threshold = timezone.now() - timedelta(minutes=options['min_age'])
+        removed = 0
+        for name in iter_files(ROOT):
+            if name in used:
+                continue
+            if content_storage.get_modified_time(name) > threshold:
+                continue
+            if not options['dry_run']:
+                content_storage.delete(name)
+            removed += 1
+            self.stdout.write(name)
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} files'))
@@ -0,0 +1,73 @@
+from time import monotonic
+
+from django.apps import apps
+from django.core.management import BaseCommand
+from django.core.serializers import sort_dependencies
+from django.core.serializers.json import Serializer
+
+
+class FixtureSerializer(Serializer):
+    """Берёт связи many-to-many из prefetch_related, а не запросом."""
+
+    def handle_m2m_field(self, obj, field):
+        if field.remote_field.through._meta.auto_created:
+            self._current[field.name] = [
+                self._value_from_field(related, related._meta.pk)
+                for related in getattr(obj, field.name).all()
+            ]
+
+
+def iter_objects(model, batch_size):
+    """Отдаёт объекты модели пачками по первичному ключу."""
+    queryset = model._default_manager.order_by('pk').prefetch_related(*(
+        field.name for field in model._meta.many_to_many
+        if field.remote_field.through._meta.auto_created
+    ))
+    last_pk = None
+    while True:
+        batch = queryset
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        batch = list(batch[:batch_size])
+        if not batch:
+            return
+        yield from batch
+        last_pk = batch[-1].pk
+
+
+class Command(BaseCommand):
+    help = (
+        'Streams all models into a JSON fixture readable by loaddata '
+        'and load_fixture.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output')
+        parser.add_argument(
+            '-e', '--exclude', action='append', default=[],
+            help='An app_label or app_label.ModelName to exclude.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = monotonic()
+        excluded = {label.lower() for label in options['exclude']}
+        app_list = [
+            (app_config, None) for app_config in apps.get_app_configs()
+            if app_config.models_module is not None
+            and app_config.label not in excluded
+        ]
+        models = [
+            model for model in sort_dependencies(app_list)
+            if model._meta.label_lower not in excluded
+            and model._meta.managed and not model._meta.proxy
+        ]
+        objects = (
+            obj for model in models
+            for obj in iter_objects(model, options['batch_size'])
+        )
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            FixtureSerializer().serialize(objects, stream=file)
+        self.stdout.write(self.style.SUCCESS(
+            f'Dumped {len(models)} models in {monotonic() - started:.2f}s'
+        ))
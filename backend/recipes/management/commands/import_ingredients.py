@@ -0,0 +1,102 @@
+import csv
+import os
+from itertools import islice
+from time import monotonic
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from recipes.management.commands._private import (iter_json_array,
+                                                  warn_if_local_cache)
+from recipes.models import Ingredient
+from recipes.versions import bump_version
+
+
+def read_csv(file):
+    reader = csv.reader(file)
+    for row in reader:
+        if not row or row == ['name', 'measurement_unit']:
+            continue
+        if len(row) != 2:
+            raise ValueError(
+                f'Line {reader.line_num}: expected name and '
+                f'measurement_unit, got {row!r}'
+            )
+        yield row[0], row[1]
+
+
+def read_json(file):
+    for number, item in enumerate(iter_json_array(file), 1):
+        if not isinstance(item, dict) or not all(
+            isinstance(item.get(key), str)
+            for key in ('name', 'measurement_unit')
+        ):
+            raise ValueError(
+                f'Item {number}: expected an object with name and '
+                f'measurement_unit, got {item!r}'
+            )
+        yield item['name'], item['measurement_unit']
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Imports ingredients from a CSV or JSON file in batches. '
+        'Existing ingredients are skipped, so the import can be re-run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=os.path.join(settings.BASE_DIR, 'ingredients.csv'),
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('Supported formats: csv, json')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        if not os.path.isfile(path):
+            raise CommandError(f'File not found: {path}')
+        started = monotonic()
+        before = Ingredient.objects.count()
+        try:
+            # Ошибка в середине файла откатывает уже вставленные пачки.
+            with open(path, encoding='utf-8') as file, transaction.atomic():
+                processed = self.import_rows(
+                    reader(file), options['batch_size']
+                )
+        except ValueError as error:
+            raise CommandError(f'Invalid file {path}: {error}') from error
+        if warn_if_local_cache(self, 'ingredients'):
+            bump_version('ingredients')
+        created = Ingredient.objects.count() - before
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {processed} rows, {created} new ingredients '
+            f'in {monotonic() - started:.2f}s'
+        ))
+
+    def import_rows(self, rows, batch_size):
+        processed = 0
+        while True:
+            batch = [
+                Ingredient(
+                    name=name.strip(),
+                    measurement_unit=measurement_unit.strip()
+                )
+                for name, measurement_unit in islice(rows, batch_size)
+            ]
+            if not batch:
+                return processed
+            Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+            processed += len(batch)
+            self.stdout.write(f'Processed {processed} rows')
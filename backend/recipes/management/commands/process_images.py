@@ -0,0 +1,22 @@
+from django.core.management import BaseCommand
+from recipes.images import process_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Builds image variants for recipes that do not have them yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true', help='Rebuild every recipe.'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_full='')
+        processed = 0
+        for recipe_id, image in recipes.values_list('id', 'image').iterator():
+            process_variants(recipe_id, image)
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} images'))
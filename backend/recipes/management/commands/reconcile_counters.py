@@ -0,0 +1,33 @@
+from django.core.management import BaseCommand, CommandError
+from django.db.models import F
+from recipes.counters import COUNTERS, actual_count
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalculates favorites, followers and recipes counters '
+        'that drifted from the actual number of rows.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive')
+        for model, field, related, lookup in COUNTERS:
+            drifted = list(model.objects.annotate(
+                actual=actual_count(related, lookup)
+            ).exclude(**{field: F('actual')}).values_list('pk', flat=True))
+            if not options['dry_run']:
+                for start in range(0, len(drifted), batch_size):
+                    # Значение считается в самом UPDATE, поэтому
+                    # параллельные изменения счётчика не теряются.
+                    model.objects.filter(
+                        pk__in=drifted[start:start + batch_size]
+                    ).update(**{field: actual_count(related, lookup)})
+            self.stdout.write(
+                f'{model._meta.label}.{field}: {len(drifted)} repaired'
+            )
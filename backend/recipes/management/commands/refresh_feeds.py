@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db.models import Count
+from recipes.models import FeedItem
+from users.models import Follow
+
+
+class Command(BaseCommand):
+    help = (
+        'Trims subscription feeds to FEED_SIZE recipes. With --rebuild '
+        'fills the feeds from subscriptions first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Add the latest recipes of every followed author.'
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            follows = Follow.objects.select_related('user', 'author')
+            for follow in follows.iterator():
+                FeedItem.backfill(follow.user, follow.author)
+            self.stdout.write(f'Rebuilt feeds for {follows.count()} follows')
+        overfull = FeedItem.objects.values('user').annotate(
+            items=Count('pk')
+        ).filter(items__gt=settings.FEED_SIZE).values_list('user', flat=True)
+        trimmed = sum(FeedItem.trim(user) for user in overfull)
+        self.stdout.write(self.style.SUCCESS(f'Trimmed {trimmed} feed items'))
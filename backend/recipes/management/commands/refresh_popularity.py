@@ -0,0 +1,24 @@
+from django.core.management import BaseCommand, CommandError
+from recipes.management.commands._private import warn_if_local_cache
+from recipes.popularity import refresh
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalculates the popularity score of recipes whose favorites '
+        'or shopping cart counters changed since the last run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--all', action='store_true', help='Recalculate every recipe.'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        refreshed = refresh(options['batch_size'], options['all'])
+        if refreshed:
+            warn_if_local_cache(self, 'popular recipe pages')
+        self.stdout.write(self.style.SUCCESS(f'Refreshed {refreshed} recipes'))
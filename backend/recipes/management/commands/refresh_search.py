@@ -0,0 +1,21 @@
+from django.core.management import BaseCommand, CommandError
+from recipes.management.commands._private import warn_if_local_cache
+from recipes.models import Recipe
+from recipes.search import update_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Recalculates full-text search vectors of all recipes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive')
+        ids = list(Recipe.objects.order_by('id').values_list('id', flat=True))
+        for start in range(0, len(ids), batch_size):
+            update_search_vectors(ids[start:start + batch_size])
+        warn_if_local_cache(self, 'search results')
+        self.stdout.write(self.style.SUCCESS(f'Refreshed {len(ids)} recipes'))
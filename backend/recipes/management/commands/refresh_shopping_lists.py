@@ -0,0 +1,28 @@
+from django.core.management import BaseCommand, CommandError
+from recipes.models import ShoppingCart, ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds shopping lists from the recipes in the carts, e.g. after '
+        'loaddata or cascade deletes that bypass the API.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive')
+        # Пользователи со строками без корзины тоже нужны: их списки
+        # устарели и должны опустеть.
+        users = sorted(
+            set(ShoppingCart.objects.values_list('user', flat=True))
+            | set(ShoppingListItem.objects.values_list('user', flat=True))
+        )
+        for start in range(0, len(users), batch_size):
+            ShoppingListItem.refresh(users[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed shopping lists of {len(users)} users'
+        ))
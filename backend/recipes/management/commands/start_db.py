@@ -3,6 +3,13 @@ from django.core.management import BaseCommand, call_command
 
 
 class Command(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fast',
+            action='store_true',
+            help='Load dump.json with load_fixture instead of loaddata.'
+        )
+
     def handle(self, *args, **options):
         print("Preparing and executing migrations")
         call_command('makemigrations')
@@ -10,6 +17,14 @@ class Command(BaseCommand):
         print("Deleting contenttypes")
         ContentType.objects.all().delete()
         print("Loading data from fixtures.")
-        call_command('loaddata', 'dump.json')
+        if options['fast']:
+            call_command('load_fixture', 'dump.json')
+        else:
+            call_command('loaddata', 'dump.json')
+        call_command('reconcile_counters')
+        call_command('refresh_shopping_lists')
+        call_command('refresh_popularity', '--all')
+        call_command('refresh_feeds', '--rebuild')
+        call_command('refresh_search')
         call_command('collectstatic', '--no-input')
         print("Done")
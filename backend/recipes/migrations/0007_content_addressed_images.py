@@ -0,0 +1,34 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:04
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(default=None, storage=recipes.storage.ContentAddressedStorage(), upload_to='recipes/images/', verbose_name='Картинка рецепта'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image_card',
+            field=models.ImageField(blank=True, storage=recipes.storage.ContentAddressedStorage(), upload_to='recipes/images/card/', verbose_name='Картинка для карточки'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image_full',
+            field=models.ImageField(blank=True, storage=recipes.storage.ContentAddressedStorage(), upload_to='recipes/images/full/', verbose_name='Картинка в полном размере'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='image_thumbnail',
+            field=models.ImageField(blank=True, storage=recipes.storage.ContentAddressedStorage(), upload_to='recipes/images/thumbnail/', verbose_name='Миниатюра'),
+        ),
+    ]
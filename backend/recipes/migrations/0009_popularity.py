@@ -0,0 +1,77 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:10
+
+import math
+from datetime import datetime
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+# Копия recipes.popularity.EPOCH: миграция не зависит от кода приложения.
+EPOCH = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+
+def fill_carts_count(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    Recipe.objects.update(carts_count=Coalesce(models.Subquery(
+        ShoppingCart.objects.filter(
+            recipe=models.OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            count=models.Count('pk')
+        ).values('count')
+    ), 0))
+
+
+def fill_popularity(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    recipes = Recipe.objects.only('favorites_count', 'carts_count', 'created')
+    batch = []
+    for recipe in recipes.iterator():
+        age = (recipe.created - EPOCH).total_seconds() / 3600
+        recipe.popularity = (
+            math.log10(1 + recipe.favorites_count + recipe.carts_count)
+            + age / settings.POPULARITY_DECAY_HOURS
+        )
+        recipe.popularity_stale = False
+        batch.append(recipe)
+        if len(batch) == 500:
+            Recipe.objects.bulk_update(batch, ('popularity', 'popularity_stale'))
+            batch = []
+    Recipe.objects.bulk_update(batch, ('popularity', 'popularity_stale'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлен в список покупок'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='popularity',
+            field=models.FloatField(default=0, editable=False, verbose_name='Популярность'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='popularity_stale',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-popularity', 'id'], name='recipe_popularity_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(popularity_stale=True), fields=['id'], name='recipe_popularity_stale_idx'),
+        ),
+        migrations.RunPython(fill_carts_count, migrations.RunPython.noop),
+        migrations.RunPython(fill_popularity, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,12 @@
 import re
 
+from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
-from django.db import models
-from users.models import User
+from django.db import models, transaction
+from django.db.models import Q, Sum
+from recipes.storage import content_storage
+from users.models import Follow, User
 
 
 class Tag(models.Model):
@@ -53,6 +57,13 @@ class Ingredient(models.Model):
                 name='unique_name_unit'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['name'],
+                name='ingredient_name_like_idx',
+                opclasses=['varchar_pattern_ops']
+            ),
+        ]
 
 
 class Recipe(models.Model):
@@ -79,9 +90,28 @@ class Recipe(models.Model):
     image = models.ImageField(
         verbose_name='Картинка рецепта',
         upload_to='recipes/images/',
+        storage=content_storage,
         default=None,
         null=False
     )
+    image_thumbnail = models.ImageField(
+        verbose_name='Миниатюра',
+        upload_to='recipes/images/thumbnail/',
+        storage=content_storage,
+        blank=True
+    )
+    image_card = models.ImageField(
+        verbose_name='Картинка для карточки',
+        upload_to='recipes/images/card/',
+        storage=content_storage,
+        blank=True
+    )
+    image_full = models.ImageField(
+        verbose_name='Картинка в полном размере',
+        upload_to='recipes/images/full/',
+        storage=content_storage,
+        blank=True
+    )
     text = models.TextField(
         verbose_name='Описание рецепта',
         blank=False,
@@ -93,14 +123,60 @@ class Recipe(models.Model):
     created = models.DateTimeField(
         auto_now_add=True,
     )
+    updated = models.DateTimeField(
+        auto_now=True,
+    )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Добавлен в избранное',
+        default=0,
+        editable=False
+    )
+    carts_count = models.PositiveIntegerField(
+        verbose_name='Добавлен в список покупок',
+        default=0,
+        editable=False
+    )
+    popularity = models.FloatField(
+        verbose_name='Популярность',
+        default=0,
+        editable=False
+    )
+    popularity_stale = models.BooleanField(
+        default=True,
+        editable=False
+    )
+    # GIN-индекс создаётся миграцией только в PostgreSQL.
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False
+    )
 
     def __str__(self):
         return self.name[:30]
 
     class Meta:
-        ordering = ('-created', 'author')
+        ordering = ('-created', 'id')
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['-created', 'id'],
+                name='recipe_created_id_idx'
+            ),
+            models.Index(
+                fields=['-popularity', 'id'],
+                name='recipe_popularity_id_idx'
+            ),
+            models.Index(
+                fields=['author', '-created', 'id'],
+                name='recipe_author_created_idx'
+            ),
+            models.Index(
+                fields=['id'],
+                name='recipe_popularity_stale_idx',
+                condition=models.Q(popularity_stale=True)
+            ),
+        ]
 
 
 class RecipeIngredient(models.Model):
@@ -150,6 +226,12 @@ class ShoppingCart(models.Model):
                 name='unique_shoppingcart',
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=('user', 'recipe'),
+                name='cart_user_recipe_idx'
+            ),
+        ]
 
     def __str__(self):
         return (
@@ -180,8 +262,193 @@ class Favorite(models.Model):
                 name='unique_favorite',
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=('user', 'recipe'),
+                name='favorite_user_recipe_idx'
+            ),
+        ]
 
     def __str__(self):
         return (
             f'{self.user.get_full_name()} --> {self.recipe.name}'
         )
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Покупатель',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Ингредиент',
+    )
+    amount = models.IntegerField(
+        verbose_name='Количество',
+        blank=True,
+        null=True
+    )
+
+    class Meta:
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Строки списка покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shoppinglist_item',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user} --> {self.ingredient} - {self.amount}'
+
+    @staticmethod
+    def lock(users):
+        """Блокирует строки пользователей до конца транзакции.
+
+        Так списки покупок одного пользователя пересчитываются по очереди.
+        Блокировку берут до изменения корзины и рецептов, чтобы
+        транзакции не ждали друг друга по кругу.
+        """
+        list(User.objects.select_for_update().filter(
+            pk__in=users
+        ).order_by('pk').values_list('pk', flat=True))
+
+    @classmethod
+    @transaction.atomic
+    def refresh(cls, users, ingredients=None):
+        """Пересчитывает суммы для пар пользователь-ингредиент.
+
+        users и ingredients - списки или подзапросы с id; без ingredients
+        списки пользователей пересчитываются целиком. Вызывается в той же
+        транзакции, что и изменение корзины.
+        """
+        cls.lock(users)
+        totals = RecipeIngredient.objects.filter(
+            recipe__in_cart__user__in=users
+        )
+        items = cls.objects.filter(user__in=users)
+        if ingredients is not None:
+            totals = totals.filter(ingredient__in=ingredients)
+            items = items.filter(ingredient__in=ingredients)
+        totals = totals.values('recipe__in_cart__user', 'ingredient').annotate(
+            total=Sum('amount')
+        ).order_by()
+        items.delete()
+        cls.objects.bulk_create(
+            cls(
+                user_id=row['recipe__in_cart__user'],
+                ingredient_id=row['ingredient'],
+                amount=row['total']
+            )
+            for row in totals
+        )
+
+
+class FeedItem(models.Model):
+    """Рецепт в ленте подписок пользователя.
+
+    Строки создаются при публикации рецепта для всех подписчиков автора,
+    поэтому лента читается по индексу одного пользователя.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Подписчик',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата публикации рецепта',
+    )
+
+    class Meta:
+        verbose_name = 'Лента подписок'
+        verbose_name_plural = 'Лента подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_item',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-created', 'recipe'),
+                name='feed_user_created_idx'
+            ),
+            models.Index(
+                fields=('user', 'author'),
+                name='feed_user_author_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user} <-- {self.recipe}'
+
+    @classmethod
+    def fan_out(cls, recipe):
+        """Добавляет новый рецепт в ленты подписчиков автора."""
+        cls.objects.bulk_create(
+            (
+                cls(
+                    user_id=user_id,
+                    recipe=recipe,
+                    author_id=recipe.author_id,
+                    created=recipe.created
+                )
+                for user_id in Follow.objects.filter(
+                    author=recipe.author_id
+                ).values_list('user', flat=True).iterator()
+            ),
+            batch_size=1000,
+            ignore_conflicts=True
+        )
+
+    @classmethod
+    @transaction.atomic
+    def backfill(cls, user, author):
+        """Добавляет в ленту последние рецепты нового автора."""
+        cls.objects.bulk_create(
+            (
+                cls(user=user, recipe_id=pk, author=author, created=created)
+                for pk, created in author.recipes.order_by(
+                    '-created', 'id'
+                ).values_list('id', 'created')[:settings.FEED_SIZE]
+            ),
+            ignore_conflicts=True
+        )
+        cls.trim(user)
+
+    @classmethod
+    def trim(cls, user):
+        """Оставляет в ленте только FEED_SIZE последних рецептов."""
+        last = cls.objects.filter(user=user).order_by(
+            '-created', 'recipe'
+        ).values_list('created', 'recipe')[
+            settings.FEED_SIZE - 1:settings.FEED_SIZE
+        ].first()
+        if last is None:
+            return 0
+        created, recipe = last
+        deleted, _ = cls.objects.filter(
+            Q(created__lt=created) | Q(created=created, recipe__gt=recipe),
+            user=user
+        ).delete()
+        return deleted
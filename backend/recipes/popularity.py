@@ -0,0 +1,54 @@
+import math
+from datetime import datetime
+
+from django.conf import settings
+from django.utils import timezone
+from recipes.models import Recipe
+from recipes.versions import bump_version
+
+EPOCH = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+
+def score(count, created):
+    """Популярность рецепта с затуханием по времени публикации.
+
+    Вклад новизны растёт со временем публикации, а не убывает с
+    возрастом, поэтому порядок рецептов не меняется сам по себе и
+    пересчитывать нужно только рецепты с изменившимися счётчиками.
+    """
+    age = (created - EPOCH).total_seconds() / 3600
+    return math.log10(1 + count) + age / settings.POPULARITY_DECAY_HOURS
+
+
+def refresh(batch_size=500, everything=False):
+    """Пересчитывает популярность пачками, возвращает число рецептов.
+
+    Таблицы избранного и списков покупок не читаются: счётчики уже есть
+    в строке рецепта.
+    """
+    recipes = Recipe.objects.order_by('id')
+    if not everything:
+        recipes = recipes.filter(popularity_stale=True)
+    refreshed = 0
+    last_id = 0
+    while True:
+        batch = list(recipes.filter(id__gt=last_id).values_list(
+            'id', flat=True
+        )[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1]
+        # Флаг снимается до чтения счётчиков: если рецепт добавят в
+        # избранное во время пересчёта, флаг будет выставлен снова.
+        Recipe.objects.filter(id__in=batch).update(popularity_stale=False)
+        changed = [
+            Recipe(id=pk, popularity=score(favorites + carts, created))
+            for pk, favorites, carts, created in Recipe.objects.filter(
+                id__in=batch
+            ).values_list('id', 'favorites_count', 'carts_count', 'created')
+        ]
+        Recipe.objects.bulk_update(changed, ('popularity',))
+        refreshed += len(changed)
+    if refreshed:
+        bump_version('popularity')
+    return refreshed
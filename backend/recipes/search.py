@@ -0,0 +1,136 @@
+import re
+from collections import defaultdict
+from threading import Lock
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection, transaction
+from django.db.models import (Case, F, FloatField, OuterRef, Subquery,
+                              TextField, Value, When)
+from recipes.models import Recipe, RecipeIngredient
+from recipes.versions import bump_version, get_version
+
+CONFIG = 'russian'
+# Веса частей рецепта, как у ts_rank по умолчанию для A, B и C.
+WEIGHTS = (('name', 1.0), ('ingredients', 0.4), ('text', 0.2))
+TOKEN = re.compile(r'\w+')
+
+_lock = Lock()
+_index = None
+
+
+def use_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def update_search_vectors(recipes):
+    """Пересчитывает поисковые векторы рецептов.
+
+    recipes — список или подзапрос с id. Без PostgreSQL векторы не
+    хранятся, и сбрасывается только индекс в памяти.
+    """
+    if use_postgres():
+        from django.contrib.postgres.aggregates import StringAgg
+
+        ingredients = Subquery(
+            RecipeIngredient.objects.filter(
+                recipe=OuterRef('pk')
+            ).order_by().values('recipe').annotate(
+                names=StringAgg('ingredient__name', ' ')
+            ).values('names'),
+            output_field=TextField()
+        )
+        Recipe.objects.filter(pk__in=recipes).update(
+            search_vector=SearchVector('name', weight='A', config=CONFIG)
+            + SearchVector(ingredients, weight='B', config=CONFIG)
+            + SearchVector('text', weight='C', config=CONFIG)
+        )
+    transaction.on_commit(lambda: bump_version('search'))
+
+
+def update_ingredient_recipes(instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        update_search_vectors(
+            RecipeIngredient.objects.filter(
+                ingredient=instance
+            ).values('recipe')
+        )
+
+
+def tokenize(text):
+    return [token.replace('ё', 'е') for token in TOKEN.findall(text.lower())]
+
+
+class SearchIndex:
+    """Обратный индекс рецептов в памяти процесса для SQLite.
+
+    Как и plainto_tsquery, находит рецепты со всеми словами запроса.
+    Релевантность — сумма весов вхождений: название важнее
+    ингредиентов, ингредиенты важнее описания.
+    """
+
+    def __init__(self, recipes, version):
+        self.version = version
+        self.postings = defaultdict(dict)
+        for pk, document in recipes:
+            for part, weight in WEIGHTS:
+                for token in tokenize(document[part]):
+                    postings = self.postings[token]
+                    postings[pk] = postings.get(pk, 0) + weight
+
+    def search(self, query):
+        """Возвращает {id рецепта: релевантность}."""
+        terms = set(tokenize(query))
+        if not terms:
+            return {}
+        postings = sorted(
+            (self.postings.get(term, {}) for term in terms), key=len
+        )
+        ranks = dict(postings[0])
+        for other in postings[1:]:
+            ranks = {
+                pk: rank + other[pk]
+                for pk, rank in ranks.items() if pk in other
+            }
+        return ranks
+
+
+def load_documents():
+    documents = {
+        pk: {'name': name, 'text': text, 'ingredients': ''}
+        for pk, name, text in Recipe.objects.order_by().values_list(
+            'id', 'name', 'text'
+        )
+    }
+    for recipe, name in RecipeIngredient.objects.values_list(
+        'recipe', 'ingredient__name'
+    ):
+        if recipe in documents:
+            documents[recipe]['ingredients'] += ' ' + name
+    return documents.items()
+
+
+def get_index():
+    """Возвращает индекс, перестраивая его после изменения рецептов."""
+    global _index
+    version, _ = get_version('search')
+    if _index is None or _index.version != version:
+        with _lock:
+            if _index is None or _index.version != version:
+                _index = SearchIndex(load_documents(), version)
+    return _index
+
+
+def search_recipes(queryset, query):
+    """Оставляет рецепты, подходящие под запрос, с аннотацией search_rank."""
+    if use_postgres():
+        search_query = SearchQuery(query, config=CONFIG)
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query)
+        )
+    ranks = get_index().search(query)
+    return queryset.filter(pk__in=list(ranks)).annotate(search_rank=Case(
+        *(When(pk=pk, then=Value(rank)) for pk, rank in ranks.items()),
+        default=Value(0.0),
+        output_field=FloatField()
+    ))
@@ -0,0 +1,31 @@
+import os
+from hashlib import sha256
+
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранит файлы под именем из sha256 содержимого.
+
+    Одинаковые картинки сохраняются один раз: повторная загрузка
+    возвращает имя уже существующего файла без записи на диск. Файлы
+    без ссылок удаляет только команда collect_images.
+    """
+
+    def save(self, name, content, max_length=None):
+        digest = sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        name = os.path.join(directory, digest.hexdigest() + extension)
+        if self.exists(name):
+            # Свежее время изменения не даёт collect_images удалить файл,
+            # пока рецепт с ним ещё не сохранён.
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
+
+
+content_storage = ContentAddressedStorage()
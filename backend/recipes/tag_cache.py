@@ -0,0 +1,29 @@
+from threading import Lock
+
+from recipes.models import Tag
+from recipes.versions import get_version
+
+_lock = Lock()
+_tags = None
+_tags_version = None
+
+
+def get_tags():
+    """Возвращает словарь slug -> (id, name) из памяти процесса."""
+    global _tags, _tags_version
+    version, _ = get_version('tags')
+    if _tags is None or _tags_version != version:
+        with _lock:
+            if _tags is None or _tags_version != version:
+                _tags = {
+                    slug: (pk, name)
+                    for pk, slug, name in Tag.objects.values_list(
+                        'id', 'slug', 'name'
+                    )
+                }
+                _tags_version = version
+    return _tags
+
+
+def tag_choices():
+    return [(slug, name) for slug, (_, name) in get_tags().items()]
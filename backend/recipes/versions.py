@@ -0,0 +1,63 @@
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+# Бэкенды, у которых каждый процесс видит только свой кеш.
+LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def is_shared_cache():
+    """Видят ли другие процессы версии, записанные в этом процессе."""
+    return settings.CACHES['default']['BACKEND'] not in LOCAL_CACHES
+
+
+def get_version(name):
+    """Возвращает токен и время последнего изменения таблицы."""
+    return cache.get_or_set(
+        f'{name}_version', lambda: (uuid4().hex, timezone.now()), None
+    )
+
+
+def get_versions(*names):
+    """Возвращает токены версий нескольких таблиц или групп за один запрос."""
+    keys = [f'{name}_version' for name in names]
+    versions = cache.get_many(keys)
+    missing = {
+        key: (uuid4().hex, timezone.now())
+        for key in keys if key not in versions
+    }
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key][0] for key in keys]
+
+
+def bump_version(name):
+    cache.set(f'{name}_version', (uuid4().hex, timezone.now()), None)
+
+
+def bump_versions(*names):
+    version = (uuid4().hex, timezone.now())
+    cache.set_many({f'{name}_version': version for name in names}, None)
+
+
+def invalidate_recipe_lists(author_id, tags):
+    """Сбрасывает закешированные страницы рецептов автора и тегов."""
+    bump_versions(
+        'recipes',
+        f'author:{author_id}',
+        *(f'tag:{tag.slug}' for tag in tags)
+    )
+
+
+def invalidate_tags(**kwargs):
+    bump_version('tags')
+
+
+def invalidate_ingredients(**kwargs):
+    bump_version('ingredients')
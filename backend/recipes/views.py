@@ -1,18 +1,98 @@
-from api.filters import IngredientFilter, RecipeFilter
+from functools import partial
+from hashlib import md5
+from itertools import chain
+
+from api.filters import RecipeFilter
+from api.pagination import PageLimitPagination, PageOrCursorPagination
 from api.permissions import IsAuthorOrReadOnly
-from api.serializers import (IngredientSerializer, RecipeSerializer,
+from api.serializers import (CookQuerySerializer, IngredientSerializer,
+                             RecipeIdsSerializer, RecipeSerializer,
                              RecipeWriteSerializer, ShortRecipeSerializer,
                              TagSerializer)
-from django.db.models import Sum
-from django.http import HttpResponse
+from api.shopping_list import FORMATS
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import BooleanField, Exists, F, OuterRef, Prefetch, Value
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+from recipes.cook_index import find_recipes
+from recipes.counters import increment
+from recipes.ingredient_index import get_index
+from recipes.models import (Favorite, FeedItem, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Tag)
+from recipes.search import search_recipes
+from recipes.versions import get_version, get_versions, invalidate_recipe_lists
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
 from rest_framework.response import Response
+from users.models import Follow, User
+
+RECIPE_LIST_CACHE_TIMEOUT = 60 * 60
+RECIPE_ORDERINGS = {
+    'new': ('-created', 'id'),
+    # Рейтинг пересчитывается командой refresh_popularity.
+    'popular': ('-popularity', 'id'),
+}
+FEED_ORDERING = ('-feed_created', 'id')
+SEARCH_ORDERING = ('-search_rank', '-created', 'id')
+
+
+def conditional_response(request, etag, modified, view):
+    """Отвечает 304 по If-None-Match/If-Modified-Since, не вызывая view."""
+    etag = quote_etag(etag)
+    last_modified = int(modified.timestamp())
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        response = view()
+    # Ответ 304 тоже несёт валидаторы, чтобы клиент обновил их у себя.
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_vary_headers(response, ('Authorization',))
+    return response
+
+
+def table_response(request, name, view):
+    token, modified = get_version(name)
+    return conditional_response(request, f'{name}-{token}', modified, view)
+
+
+def recipe_list_key(request):
+    """Ключ кеша страницы рецептов по нормализованным параметрам."""
+    params = request.query_params
+    author = params.get('author', '')
+    tags = sorted(set(params.getlist('tags')))
+    groups = [f'tag:{slug}' for slug in tags]
+    if author:
+        groups.append(f'author:{author}')
+    if not groups:
+        groups.append('recipes')
+    ordering = params.get('ordering', '')
+    if ordering == 'popular':
+        groups.append('popularity')
+    search = params.get('search', '')
+    if search:
+        groups.append('search')
+    versions = get_versions('tags', 'ingredients', *groups)
+    return 'recipe_list:' + md5(':'.join((
+        request.get_host(),
+        params.get('page', '1'),
+        params.get('limit', ''),
+        params.get('pagination', ''),
+        params.get('cursor', ''),
+        ordering,
+        search,
+        author,
+        ','.join(tags),
+        *versions,
+    )).encode()).hexdigest()
 
 
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
@@ -20,29 +100,176 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        return table_response(
+            request, 'tags',
+            partial(super().list, request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return table_response(
+            request, 'tags',
+            partial(super().retrieve, request, *args, **kwargs)
+        )
+
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = IngredientSerializer
     queryset = Ingredient.objects.all()
     pagination_class = None
-    filter_backends = (DjangoFilterBackend,)
-    filter_class = IngredientFilter
-    search_fields = ('^name',)
+
+    def list(self, request, *args, **kwargs):
+        return table_response(
+            request, 'ingredients', partial(self.search, request)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return table_response(
+            request, 'ingredients',
+            partial(super().retrieve, request, *args, **kwargs)
+        )
+
+    def search(self, request):
+        index = get_index()
+        name = request.query_params.get('name')
+        if name:
+            return Response(index.search(name))
+        return Response(index.items)
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    pagination_class = PageOrCursorPagination
     http_method_names = ('get', 'post', 'delete', 'patch')
     permission_classes = (IsAuthorOrReadOnly, )
 
+    @property
+    def cursor_ordering(self):
+        if self.action == 'feed':
+            return FEED_ORDERING
+        if self.searching:
+            return SEARCH_ORDERING
+        return RECIPE_ORDERINGS.get(
+            self.request.query_params.get('ordering'),
+            RECIPE_ORDERINGS['new']
+        )
+
+    @property
+    def searching(self):
+        return self.action == 'list' and self.request.query_params.get(
+            'search'
+        )
+
+    def get_queryset(self):
+        recipes = Recipe.objects.all()
+        if self.searching:
+            recipes = search_recipes(
+                recipes, self.request.query_params['search']
+            )
+        if self.action == 'feed':
+            # Порядок ленты совпадает с индексом (user, -created, recipe).
+            recipes = recipes.filter(
+                feed_items__user=self.request.user
+            ).annotate(feed_created=F('feed_items__created'))
+        return self.annotate_flags(
+            recipes.order_by(
+                *self.cursor_ordering
+            ).select_related('author').prefetch_related(
+                'tags',
+                Prefetch(
+                    'ingredient',
+                    queryset=RecipeIngredient.objects.select_related(
+                        'ingredient'
+                    ),
+                    to_attr='recipe_ingredients'
+                )
+            )
+        )
+
+    def annotate_flags(self, queryset):
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField())
+            )
+        return queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            ))
+        )
+
+    def list(self, request, *args, **kwargs):
+        # Для анонимов ответ не зависит от пользователя и кешируется целиком.
+        if not request.user.is_anonymous:
+            return super().list(request, *args, **kwargs)
+        key = recipe_list_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, RECIPE_LIST_CACHE_TIMEOUT)
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        user = request.user
+        state = self.annotate_flags(
+            Recipe.objects.filter(pk=kwargs['pk'])
+        ).annotate(
+            is_subscribed=Exists(Follow.objects.filter(
+                user=user.id, author=OuterRef('author')
+            ))
+        ).values(
+            'updated', 'is_favorited', 'is_in_shopping_cart', 'is_subscribed',
+            'author__email', 'author__username', 'author__first_name',
+            'author__last_name'
+        ).first()
+        if state is None:
+            raise Http404
+        # Ответ зависит от пользователя, от данных автора, которые меняются
+        # без обновления рецепта, и от версий тегов и ингредиентов.
+        tags_version, tags_modified = get_version('tags')
+        ingredients_version, ingredients_modified = get_version('ingredients')
+        etag = md5(':'.join(str(value) for value in (
+            kwargs['pk'],
+            user.id,
+            *state.values(),
+            tags_version,
+            ingredients_version,
+        )).encode()).hexdigest()
+        return conditional_response(
+            request, etag,
+            max(state['updated'], tags_modified, ingredients_modified),
+            partial(super().retrieve, request, *args, **kwargs)
+        )
+
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        recipe = serializer.save(author=self.request.user)
+        FeedItem.fan_out(recipe)
 
     def destroy(self, instance, *args, **kwargs):
         instance = self.get_object()
-        self.perform_destroy(instance)
+        buyers = list(instance.in_cart.values_list('user', flat=True))
+        ingredients = list(
+            instance.ingredient.values_list('ingredient', flat=True)
+        )
+        tags = list(instance.tags.all())
+        with transaction.atomic():
+            ShoppingListItem.lock(buyers)
+            self.perform_destroy(instance)
+            increment(
+                User.objects.filter(pk=instance.author_id), 'recipes_count', -1
+            )
+            if buyers:
+                ShoppingListItem.refresh(buyers, ingredients)
+        invalidate_recipe_lists(instance.author_id, tags)
         return Response(
             'Рецепт успешно удалён.',
             status=status.HTTP_204_NO_CONTENT
@@ -68,13 +295,23 @@ class RecipeViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             serializer = ShortRecipeSerializer(recipe)
-            Favorite.objects.create(user=user, recipe=recipe)
+            with transaction.atomic():
+                Favorite.objects.create(user=user, recipe=recipe)
+                increment(
+                    Recipe.objects.filter(pk=recipe.pk), 'favorites_count',
+                    popularity_stale=True
+                )
             return Response(
                 serializer.data,
                 status=status.HTTP_201_CREATED
             )
         if obj.exists():
-            obj.delete()
+            with transaction.atomic():
+                deleted, _ = obj.delete()
+                increment(
+                    Recipe.objects.filter(pk=recipe.pk), 'favorites_count',
+                    -deleted, popularity_stale=True
+                )
             return Response(
                 {'message': 'Рецепт удалён из избранного!'},
                 status=status.HTTP_204_NO_CONTENT
@@ -99,13 +336,31 @@ class RecipeViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             serializer = ShortRecipeSerializer(recipe)
-            ShoppingCart.objects.create(user=user, recipe=recipe)
+            with transaction.atomic():
+                ShoppingListItem.lock([user.id])
+                ShoppingCart.objects.create(user=user, recipe=recipe)
+                increment(
+                    Recipe.objects.filter(pk=recipe.pk), 'carts_count',
+                    popularity_stale=True
+                )
+                ShoppingListItem.refresh(
+                    [user.id], recipe.ingredient.values('ingredient')
+                )
             return Response(
                 serializer.data,
                 status=status.HTTP_201_CREATED
             )
         if obj.exists():
-            obj.delete()
+            with transaction.atomic():
+                ShoppingListItem.lock([user.id])
+                deleted, _ = obj.delete()
+                increment(
+                    Recipe.objects.filter(pk=recipe.pk), 'carts_count',
+                    -deleted, popularity_stale=True
+                )
+                ShoppingListItem.refresh(
+                    [user.id], recipe.ingredient.values('ingredient')
+                )
             return Response(
                 {'message': 'Рецепт удалён из списка покупок!'},
                 status=status.HTTP_204_NO_CONTENT
@@ -115,30 +370,168 @@ class RecipeViewSet(viewsets.ModelViewSet):
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    def bulk_relation(self, request, model, counter, messages):
+        """Добавляет или удаляет связи пользователя сразу с многими рецептами.
+
+        Результат по каждому рецепту такой же, как у действия для одного
+        рецепта. Возвращает ответ и id изменённых рецептов.
+        """
+        query = RecipeIdsSerializer(data=request.data)
+        query.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(query.validated_data['recipes']))
+        user = request.user
+        recipes = Recipe.objects.in_bulk(ids)
+        adding = request.method == 'POST'
+        with transaction.atomic():
+            # Связи читаются под блокировкой пользователя: иначе два
+            # одновременных запроса оба добавят рецепт и оба увеличат
+            # счётчик, хотя bulk_create вставит строку только один раз.
+            ShoppingListItem.lock([user.id])
+            present = set(model.objects.filter(
+                user=user, recipe__in=ids
+            ).values_list('recipe', flat=True))
+            changed = {pk for pk in recipes if (pk in present) != adding}
+            if adding:
+                model.objects.bulk_create(
+                    (model(user=user, recipe_id=pk) for pk in changed),
+                    ignore_conflicts=True
+                )
+            else:
+                model.objects.filter(user=user, recipe__in=changed).delete()
+            increment(
+                Recipe.objects.filter(pk__in=changed), counter,
+                1 if adding else -1, popularity_stale=True
+            )
+        results = []
+        for pk in ids:
+            if pk not in recipes:
+                results.append({
+                    'id': pk,
+                    'status': status.HTTP_404_NOT_FOUND,
+                    'message': NotFound.default_detail,
+                })
+            elif pk not in changed:
+                results.append({
+                    'id': pk,
+                    'status': status.HTTP_400_BAD_REQUEST,
+                    'message': messages['unchanged'],
+                })
+            elif adding:
+                results.append({
+                    'id': pk,
+                    'status': status.HTTP_201_CREATED,
+                    'recipe': ShortRecipeSerializer(recipes[pk]).data,
+                })
+            else:
+                results.append({
+                    'id': pk,
+                    'status': status.HTTP_204_NO_CONTENT,
+                    'message': messages['removed'],
+                })
+        return Response(results), changed
+
+    @action(
+        detail=False, methods=['post', 'delete'],
+        url_path='favorite', url_name='favorite-bulk',
+        permission_classes=(IsAuthenticated,)
+    )
+    def favorite_bulk(self, request):
+        response, _ = self.bulk_relation(
+            request, Favorite, 'favorites_count', {
+                'unchanged': (
+                    'Рецепт уже есть в избранном!'
+                    if request.method == 'POST'
+                    else 'Такого рецепта нет в вашем избранном'
+                ),
+                'removed': 'Рецепт удалён из избранного!',
+            }
+        )
+        return response
+
+    @action(
+        detail=False, methods=['post', 'delete'],
+        url_path='shopping_cart', url_name='shopping-cart-bulk',
+        permission_classes=(IsAuthenticated,)
+    )
+    @transaction.atomic
+    def shopping_cart_bulk(self, request):
+        # Блокировку пользователя bulk_relation держит до конца транзакции,
+        # пока пересчитывается список покупок.
+        response, changed = self.bulk_relation(
+            request, ShoppingCart, 'carts_count', {
+                'unchanged': (
+                    'Рецепт уже есть в списке покупок!'
+                    if request.method == 'POST'
+                    else 'Такого рецепта нет в вашем списке покупок'
+                ),
+                'removed': 'Рецепт удалён из списка покупок!',
+            }
+        )
+        if changed:
+            ShoppingListItem.refresh(
+                [request.user.id],
+                RecipeIngredient.objects.filter(
+                    recipe__in=changed
+                ).values('ingredient')
+            )
+        return response
+
+    @action(
+        detail=False, methods=['get', ],
+        permission_classes=(IsAuthenticated,)
+    )
+    def feed(self, request):
+        return super().list(request)
+
+    @action(detail=False, methods=['get', ])
+    def cook(self, request):
+        """Рецепты, для которых больше всего продуктов уже есть дома."""
+        query = CookQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        paginator = PageLimitPagination()
+        page = paginator.paginate_queryset(
+            find_recipes(**query.validated_data), request, view=self
+        )
+        recipes = self.get_queryset().in_bulk(pk for pk, _, _ in page)
+        # Рецепт могли удалить после синхронизации индекса.
+        page = [item for item in page if item[0] in recipes]
+        results = RecipeSerializer(
+            [recipes[pk] for pk, _, _ in page],
+            many=True,
+            context=self.get_serializer_context()
+        ).data
+        for data, (_, matched, missing) in zip(results, page):
+            data['matched_ingredients'] = matched
+            data['missing_ingredients'] = missing
+        return paginator.get_paginated_response(results)
+
     @action(
         detail=False, methods=['get', ],
         permission_classes=(IsAuthenticated,)
     )
     def download_shopping_cart(self, request):
         user = request.user
-        if not user.buyer.exists():
+        file_format = request.query_params.get('file_format', 'txt')
+        if file_format not in FORMATS:
             return Response(
-                {'message': 'Список покупок не найден'},
+                {'file_format': f'Доступные форматы: {", ".join(FORMATS)}'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        ingredients_list = RecipeIngredient.objects.filter(
-            recipe__in_cart__user=user
-        ).values('ingredient__name', 'ingredient__measurement_unit').annotate(
-            amount=Sum('amount')
-        )
-        data_file = 'Список покупок\n\n'
-        for ingredient in ingredients_list:
-            data_file += '- '.join([
-                f'{ingredient["ingredient__name"]} '
-                f'({ingredient["ingredient__measurement_unit"]}) - '
-                f'{ingredient["amount"]}\n']
+        ingredients = ShoppingListItem.objects.filter(user=user).values(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ).order_by('ingredient__name').iterator()
+        # Первая строка выборки заодно проверяет, что список не пуст.
+        first = next(ingredients, None)
+        if first is None:
+            return Response(
+                {'message': 'Список покупок не найден'},
+                status=status.HTTP_400_BAD_REQUEST
             )
-        filename = f'{user}_shopping_cart.txt'
-        response = HttpResponse(data_file, content_type='text/plain')
-        response['Content-Disposition'] = f'attachement; filename={filename}'
+        lines, content_type = FORMATS[file_format]
+        response = StreamingHttpResponse(
+            lines(chain((first,), ingredients)),
+            content_type=content_type
+        )
+        filename = f'{user}_shopping_cart.{file_format}'
+        response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
@@ -30,6 +30,14 @@ class User(AbstractUser):
         'Фамилия',
         max_length=150,
         blank=True)
+    followers_count = models.PositiveIntegerField(
+        'Кол-во подписчиков',
+        default=0,
+        editable=False)
+    recipes_count = models.PositiveIntegerField(
+        'Кол-во рецептов',
+        default=0,
+        editable=False)
 
     class Meta:
         ordering = ('pk', )
@@ -76,6 +84,12 @@ class Follow(models.Model):
                 check=~models.Q(user=models.F('author')),
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=('user', 'author'),
+                name='follow_user_author_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.user} --> {self.author}'
@@ -1,10 +1,15 @@
+from api.pagination import PageOrCursorPagination
 from api.serializers import (ChangePasswordSerializer, FollowSerializer,
                              SignupSerializer, UserSerializer)
+from django.db import transaction
+from django.db.models import F, Prefetch, Window, prefetch_related_objects
+from django.db.models.functions import RowNumber
 from django.http import QueryDict
 from django.shortcuts import get_object_or_404
+from recipes.counters import increment
+from recipes.models import FeedItem, Recipe
 from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from users.models import Follow, User
@@ -14,9 +19,41 @@ class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     filter_backends = (filters.SearchFilter,)
     search_fields = ('username',)
-    pagination_class = PageNumberPagination
+    pagination_class = PageOrCursorPagination
+    cursor_ordering = ('id',)
     http_method_names = ('get', 'post', 'delete')
 
+    def with_recipes(self, authors):
+        """Подгружает рецепты авторов, не больше recipes_limit на автора.
+
+        Рецепты нумеруются внутри автора одним запросом и только для
+        авторов страницы, без коррелированного подзапроса на каждый рецепт.
+        """
+        recipes = Recipe.objects.all()
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit and recipes_limit.isdigit():
+            ranked = Recipe.objects.filter(author__in=authors).annotate(
+                recipe_rank=Window(
+                    RowNumber(),
+                    partition_by=[F('author')],
+                    order_by=[F('created').desc(), F('id').asc()]
+                )
+            ).order_by().values('id', 'recipe_rank')
+            sql, params = ranked.query.sql_with_params()
+            # RawSQL в pk__in оборачивается в скобки и превращается
+            # в скалярный подзапрос, поэтому условие задаётся через extra.
+            recipes = recipes.extra(
+                where=[
+                    f'{Recipe._meta.db_table}.id IN (SELECT ranked.id '
+                    f'FROM ({sql}) AS ranked WHERE ranked.recipe_rank <= %s)'
+                ],
+                params=[*params, int(recipes_limit)]
+            )
+        prefetch_related_objects(
+            authors, Prefetch('recipes', queryset=recipes)
+        )
+        return authors
+
     def get_serializer_class(self):
         if self.action in ('retrieve', 'list'):
             return UserSerializer
@@ -87,22 +124,29 @@ class UserViewSet(viewsets.ModelViewSet):
     )
     def subscribe(self, request, pk=None):
         user = request.user
-        author = get_object_or_404(User, pk=pk)
         if request.method == 'POST':
+            author = get_object_or_404(User, pk=pk)
+            self.with_recipes([author])
             serializer = FollowSerializer(
                 author,
                 data=request.data,
                 context={'request': request}
             )
             serializer.is_valid(raise_exception=True)
-            Follow.objects.create(user=user, author=author)
+            with transaction.atomic():
+                Follow.objects.create(user=user, author=author)
+                increment(User.objects.filter(pk=author.pk), 'followers_count')
+                FeedItem.backfill(user, author)
             return Response(
                 serializer.data,
                 status=status.HTTP_201_CREATED
             )
 
-        obj = get_object_or_404(Follow, user=user, author=author)
-        obj.delete()
+        obj = get_object_or_404(Follow, user=user, author_id=pk)
+        with transaction.atomic():
+            obj.delete()
+            increment(User.objects.filter(pk=pk), 'followers_count', -1)
+            FeedItem.objects.filter(user=user, author_id=pk).delete()
         return Response(
             {'message': 'Подписка удалена!'},
             status=status.HTTP_204_NO_CONTENT
@@ -114,8 +158,10 @@ class UserViewSet(viewsets.ModelViewSet):
     )
     def subscriptions(self, request):
         user = request.user
-        queryset = self.paginate_queryset(
+        queryset = self.with_recipes(self.paginate_queryset(
             queryset=User.objects.filter(following__user=user),
+        ))
+        serializer = FollowSerializer(
+            queryset, many=True, context={'request': request}
         )
-        serializer = FollowSerializer(queryset, many=True)
         return self.get_paginated_response(serializer.data)